@@ -12,17 +12,25 @@ import asyncio
 import aiosqlite
 from typing import Optional, Any
 from pathlib import Path
+from serialization import dumps, loads
 
 logger = logging.getLogger(__name__)
 
 DB_FILE = Path("/app/cache_data.sqlite")
 OLD_CACHE_FILE = Path("/app/cache_data.json")
+# Stored value format, tracked in PRAGMA user_version.
+# 1: every value is a validated ParsedContent dump (no {"ok":..,"data":..} wrapper)
+CACHE_FORMAT = 1
 
 class ParseCache:
     def __init__(self, ttl_seconds: int = 3600):
         self._ttl = ttl_seconds
         self._db_initialized = False
 
+    @property
+    def ttl(self) -> int:
+        return self._ttl
+
     async def _ensure_db(self):
         """Ensure the database and table exist. Handles migration from JSON."""
         if self._db_initialized:
@@ -52,8 +60,9 @@ class ParseCache:
                         # Handle both [value, timestamp] and (value, timestamp) formats
                         if isinstance(val_stamp, (list, tuple)) and len(val_stamp) == 2:
                             value, timestamp = val_stamp
-                            if current_time - timestamp <= self._ttl:
-                                entries.append((key, json.dumps(value), timestamp))
+                            value = self._unwrap(value)
+                            if current_time - timestamp <= self._ttl and self._is_valid_response(value):
+                                entries.append((key, dumps(value).decode('utf-8'), timestamp))
                     
                     if entries:
                         await db.executemany(
@@ -67,9 +76,45 @@ class ParseCache:
                     OLD_CACHE_FILE.rename(OLD_CACHE_FILE.with_suffix(".json.bak"))
                 except Exception as e:
                     logger.error(f"Migration failed: {e}")
+            
+            async with db.execute("PRAGMA user_version") as cursor:
+                version = (await cursor.fetchone())[0]
+            if version < CACHE_FORMAT:
+                await self._upgrade_entries(db)
+                await db.execute(f"PRAGMA user_version = {CACHE_FORMAT}")
+                await db.commit()
                     
         self._db_initialized = True
 
+    async def _upgrade_entries(self, db: aiosqlite.Connection):
+        """Rewrite legacy ParseResponse-wrapped entries as plain ParsedContent and drop invalid ones."""
+        logger.info("Upgrading cache entries to current format...")
+        updates, deletes = [], []
+        async with db.execute("SELECT key, value FROM cache") as cursor:
+            async for key, value_json in cursor:
+                try:
+                    data = loads(value_json)
+                except ValueError:
+                    deletes.append((key,))
+                    continue
+                inner = self._unwrap(data)
+                if not self._is_valid_response(inner):
+                    deletes.append((key,))
+                elif inner is not data:
+                    updates.append((dumps(inner).decode('utf-8'), key))
+        if updates:
+            await db.executemany("UPDATE cache SET value = ? WHERE key = ?", updates)
+        if deletes:
+            await db.executemany("DELETE FROM cache WHERE key = ?", deletes)
+        logger.info(f"Upgraded {len(updates)} entries, dropped {len(deletes)} invalid entries")
+
+    @staticmethod
+    def _unwrap(data: Any) -> Any:
+        """Extract ParsedContent from a full ParseResponse dict stored by earlier versions."""
+        if isinstance(data, dict) and 'data' in data and 'type' not in data:
+            return data['data']
+        return data
+
     def _make_hash(self, content: str) -> str:
         """Generate a stable hash for the markdown content."""
         return hashlib.md5(content.encode('utf-8')).hexdigest()
@@ -106,8 +151,11 @@ class ParseCache:
         
         return False
 
-    async def get(self, content: str) -> Optional[Any]:
-        """Get cached response if content hash matches and not expired."""
+    async def get_raw(self, content: str) -> Optional[tuple[str, float]]:
+        """
+        Get the stored ParsedContent JSON text and its timestamp without decoding it.
+        Entries are validated on write (and on format upgrade), so the hit path can return them as-is.
+        """
         await self._ensure_db()
         content_hash = self._make_hash(content)
         
@@ -116,25 +164,27 @@ class ParseCache:
                 row = await cursor.fetchone()
                 if row:
                     value_json, timestamp = row
-                    # Check if expired
                     if time.time() - timestamp > self._ttl:
                         await db.execute("DELETE FROM cache WHERE key = ?", (content_hash,))
                         await db.commit()
                         return None
-                    
-                    try:
-                        data = json.loads(value_json)
-                        if self._is_valid_response(data):
-                            return data
-                        else:
-                            await db.execute("DELETE FROM cache WHERE key = ?", (content_hash,))
-                            await db.commit()
-                            return None
-                    except json.JSONDecodeError:
-                        return None
+                    return value_json, timestamp
         
         return None
 
+    async def touch(self, content: str) -> bool:
+        """
+        Renew the timestamp of an existing entry for unchanged content.
+        Returns False if there is no entry, so the caller must extract it again.
+        """
+        await self._ensure_db()
+        content_hash = self._make_hash(content)
+        
+        async with aiosqlite.connect(DB_FILE) as db:
+            cursor = await db.execute("UPDATE cache SET timestamp = ? WHERE key = ?", (time.time(), content_hash))
+            await db.commit()
+            return cursor.rowcount > 0
+
     async def set(self, content: str, data: Any):
         """Cache response keyed by content hash."""
         if not content:
@@ -147,7 +197,7 @@ class ParseCache:
             async with aiosqlite.connect(DB_FILE) as db:
                 await db.execute(
                     "INSERT OR REPLACE INTO cache (key, value, timestamp) VALUES (?, ?, ?)",
-                    (content_hash, json.dumps(data), time.time())
+                    (content_hash, dumps(data).decode('utf-8'), time.time())
                 )
                 
                 # Cleanup expired entries occasionally (1% chance per set)
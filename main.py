@@ -1,10 +1,13 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from contextlib import asynccontextmanager
-from models import UrlRequest, ParseResponse, ParsedContent
+from models import UrlRequest, ParsedContent, ProjectedParseResponse, WatchlistRequest
 from fetcher import fetch_page_html, initialize_browser, close_browser
 from cleaner import clean_html
 from llm_client import extract_content
 from cache import get_cache
+from prewarm import get_prewarmer, BudgetExhausted
+from serialization import dumps, loads, project, envelope, json_response
+from typing import Optional
 import logging
 import asyncio
 
@@ -17,18 +20,81 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up: Initializing browser...")
     await initialize_browser()
+    await get_prewarmer().start(refresh_url)
     yield
     # Shutdown
+    await get_prewarmer().stop()
     logger.info("Shutting down: Closing browser...")
     await close_browser()
 
 app = FastAPI(title="AI Parser Microservice", lifespan=lifespan)
 
-@app.post("/parse", response_model=ParseResponse)
-async def parse_url(request: UrlRequest):
+async def extract_and_cache(url: str, raw_html: str, markdown_content: str) -> dict:
+    """Extract content via LLM (with readability fallback), validate it and cache the result."""
+    # 4. Extract Content Directly via LLM (no code generation)
+    logger.info("Extracting content via LLM...")
+    parsed_data = await extract_content(markdown_content, base_url=url)
+    
+    # 5. Fallback to readability if LLM failed or returned minimal data
+    if (parsed_data.get("type") == "unknown" or 
+        not parsed_data.get("title") or 
+        parsed_data.get("title") in ["Error extracting content", "403 - Forbidden", "nytimes.com"]):
+        logger.info("LLM extraction minimal, trying readability fallback...")
+        from readability_fallback import extract_with_readability
+        fallback_data = extract_with_readability(raw_html, url)
+        # Merge: prefer fallback for content, keep LLM for images if available
+        if fallback_data.get("full_text"):
+            parsed_data = fallback_data
+    
+    # 6. Validation & Response Construction
+    if not isinstance(parsed_data, dict):
+        logger.warning(f"Unexpected type {type(parsed_data)}, using fallback...")
+        parsed_data = {"type": "unknown", "items": [], "images": [], "videos": []}
+
+    # Ensure type field exists
+    if "type" not in parsed_data:
+        parsed_data["type"] = "unknown"
+
+    # Construct Pydantic model
+    valid_keys = ParsedContent.model_fields.keys()
+    filtered_data = {k: v for k, v in parsed_data.items() if k in valid_keys}
+    
+    result = ParsedContent(**filtered_data)
+    logger.info(f"Parsing successful. Type: {result.type}")
+    
+    # Cache the full result for this specific content; projection only applies to the response
+    result_data = result.model_dump()
+    await get_cache().set(markdown_content, result_data)
+    return result_data
+
+async def refresh_url(url: str, take_llm_budget) -> bool:
+    """
+    Re-fetch a URL in the background to keep its cache entry warm.
+    Unchanged content only renews the entry; changed content is re-extracted
+    if the LLM budget allows. Returns True if an LLM call was made.
+    """
+    raw_html = await fetch_page_html(url)
+    markdown_content = clean_html(raw_html)
+    if await get_cache().touch(markdown_content):
+        return False
+    if not take_llm_budget():
+        raise BudgetExhausted(url)
+    await extract_and_cache(url, raw_html, markdown_content)
+    return True
+
+# The handler returns pre-serialized bytes, so the schema is documented rather than enforced
+@app.post("/parse", response_model=None, responses={
+    200: {
+        "model": ProjectedParseResponse,
+        "description": "Parsed content. With `fields`, `data` only contains the requested keys.",
+    },
+})
+async def parse_url(request: UrlRequest, accept_encoding: Optional[str] = Header(None)):
     logger.info(f"Received request to parse: {request.url}")
+    get_prewarmer().record(request.url)
     
-    async def process_logic():
+    async def process_logic() -> bytes:
+        """Run the pipeline and return the serialized (projected) `data` payload."""
         # 1. Fetch HTML
         logger.info("Fetching HTML...")
         raw_html = await fetch_page_html(request.url)
@@ -39,62 +105,33 @@ async def parse_url(request: UrlRequest):
 
         # 3. Check Cache by Content Hash
         cache = get_cache()
-        cached_data = await cache.get(markdown_content)
-        if cached_data:
+        cached = await cache.get_raw(markdown_content)
+        if cached:
             logger.info(f"Cache HIT for content at {request.url}")
-            # The cached data is already a dict that matches ParsedContent or ParseResponse
-            # If it's the full ParseResponse dict from previous implementation, extract 'data'
-            inner_data = cached_data.get('data') if isinstance(cached_data, dict) and 'data' in cached_data else cached_data
-            return ParsedContent(**inner_data)
-        
-        # 4. Extract Content Directly via LLM (no code generation)
-        logger.info("Extracting content via LLM...")
-        parsed_data = await extract_content(markdown_content, base_url=request.url)
+            cached_json, cached_at = cached
+            get_prewarmer().mark_fresh(request.url, cached_at, hit=True)
+            # Stored entries are validated ParsedContent dumps: return the bytes untouched
+            if request.fields is None:
+                return cached_json.encode('utf-8')
+            return dumps(project(loads(cached_json), request.fields))
         
-        # 5. Fallback to readability if LLM failed or returned minimal data
-        if (parsed_data.get("type") == "unknown" or 
-            not parsed_data.get("title") or 
-            parsed_data.get("title") in ["Error extracting content", "403 - Forbidden", "nytimes.com"]):
-            logger.info("LLM extraction minimal, trying readability fallback...")
-            from readability_fallback import extract_with_readability
-            fallback_data = extract_with_readability(raw_html, request.url)
-            # Merge: prefer fallback for content, keep LLM for images if available
-            if fallback_data.get("full_text"):
-                parsed_data = fallback_data
+        # 4-6. Extract via LLM, validate and cache
+        result_data = await extract_and_cache(request.url, raw_html, markdown_content)
+        get_prewarmer().mark_fresh(request.url)
         
-        # 6. Validation & Response Construction
-        if not isinstance(parsed_data, dict):
-            logger.warning(f"Unexpected type {type(parsed_data)}, using fallback...")
-            parsed_data = {"type": "unknown", "items": [], "images": [], "videos": []}
-
-        # Ensure type field exists
-        if "type" not in parsed_data:
-            parsed_data["type"] = "unknown"
-
-        # Construct Pydantic model
-        valid_keys = ParsedContent.model_fields.keys()
-        filtered_data = {k: v for k, v in parsed_data.items() if k in valid_keys}
-        
-        result = ParsedContent(**filtered_data)
-        
-        # Cache the result for this specific content
-        await cache.set(markdown_content, result.model_dump())
-        
-        return result
+        return dumps(project(result_data, request.fields))
 
     try:
         # Enforce a global timeout of 90 seconds for the entire operation
-        content = await asyncio.wait_for(process_logic(), timeout=90)
-        
-        logger.info(f"Parsing successful. Type: {content.type}")
-        return ParseResponse(ok=True, data=content)
+        data_json = await asyncio.wait_for(process_logic(), timeout=90)
+        return json_response(envelope(data_json), accept_encoding)
 
     except asyncio.TimeoutError:
         logger.error(f"Request timed out processing {request.url}")
-        return ParseResponse(ok=False, error="Processing timed out (server limit)")
+        return json_response(envelope(error="Processing timed out (server limit)"), accept_encoding)
     except Exception as e:
         logger.error(f"Error processing request: {e}")
-        return ParseResponse(ok=False, error=str(e))
+        return json_response(envelope(error=str(e)), accept_encoding)
 
 @app.get("/cache/stats")
 async def cache_stats():
@@ -107,8 +144,32 @@ async def clear_cache():
     """Clear all cached entries."""
     cache = get_cache()
     await cache.clear()
+    get_prewarmer().invalidate()
     return {"message": "Cache cleared successfully"}
 
+@app.get("/prewarm/stats")
+async def prewarm_stats():
+    """Get pre-warmer statistics."""
+    return get_prewarmer().stats()
+
+@app.post("/prewarm/watchlist")
+async def add_to_watchlist(request: WatchlistRequest):
+    """Add URLs that should always be kept warm."""
+    try:
+        await get_prewarmer().add_urls(request.urls)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": f"Added {len(request.urls)} URLs to watchlist"}
+
+@app.post("/prewarm/watchlist/remove")
+async def remove_from_watchlist(request: WatchlistRequest):
+    """Remove URLs from the watchlist."""
+    try:
+        await get_prewarmer().remove_urls(request.urls)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": f"Removed {len(request.urls)} URLs from watchlist"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,11 +1,37 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from typing import Optional, Literal, List, Any
+from urllib.parse import urlparse
 
 class UrlRequest(BaseModel):
     url: str
     instruction: Optional[str] = None
     schema_map: Optional[dict[str, str]] = None
     page_type: Optional[Literal["list", "detail"]] = None
+    # Top-level ParsedContent fields to return, e.g. ["title", "items"]. None returns everything.
+    fields: Optional[list[str]] = None
+
+    @field_validator("fields")
+    @classmethod
+    def check_fields(cls, v: Optional[list[str]]) -> Optional[list[str]]:
+        if v is None:
+            return v
+        if not v:
+            raise ValueError("fields must not be empty; omit it to return all fields")
+        unknown = [f for f in v if f not in ParsedContent.model_fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return list(dict.fromkeys(v))
+
+class WatchlistRequest(BaseModel):
+    urls: list[str]
+
+    @field_validator("urls")
+    @classmethod
+    def check_urls(cls, v: list[str]) -> list[str]:
+        invalid = [u for u in v if urlparse(u).scheme not in ("http", "https") or not urlparse(u).netloc]
+        if invalid:
+            raise ValueError(f"Only http(s) URLs are allowed: {', '.join(invalid[:5])}")
+        return list(dict.fromkeys(v))
 
 class ParsedImage(BaseModel):
     url: str
@@ -32,3 +58,12 @@ class ParseResponse(BaseModel):
     ok: bool
     data: Optional[ParsedContent] = None
     error: Optional[str] = None
+
+class ProjectedContent(ParsedContent):
+    """ParsedContent limited to the requested `fields`; every key may be absent."""
+    type: Optional[Literal["detail", "list", "unknown"]] = None
+
+class ProjectedParseResponse(BaseModel):
+    ok: bool
+    data: Optional[ProjectedContent] = None
+    error: Optional[str] = None
@@ -0,0 +1,250 @@
+"""
+Background pre-warming of the parse cache for recurring URLs.
+Learns request frequency from /parse traffic (plus an explicit watchlist) and
+re-fetches hot URLs before their cache entries expire, so callers get a warm hit
+instead of paying for the LLM call on their critical path.
+"""
+import os
+import time
+import asyncio
+import logging
+import aiosqlite
+from typing import Awaitable, Callable, Optional
+from cache import get_cache, DB_FILE
+
+logger = logging.getLogger(__name__)
+
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "true").lower() in ("1", "true", "yes")
+PREWARM_INTERVAL = float(os.getenv("PREWARM_INTERVAL", "60"))          # seconds between scheduling passes
+PREWARM_REFRESH_RATIO = float(os.getenv("PREWARM_REFRESH_RATIO", "0.75"))  # refresh after this fraction of the TTL
+# Each render takes several seconds and every URL is refreshed about once per PREWARM_REFRESH_RATIO * TTL,
+# so PREWARM_MAX_URLS should stay below roughly PREWARM_CONCURRENCY * PREWARM_REFRESH_RATIO * TTL / 5s
+PREWARM_MAX_URLS = int(os.getenv("PREWARM_MAX_URLS", "500"))           # watchlist + hottest learned URLs kept warm
+PREWARM_MIN_HITS = float(os.getenv("PREWARM_MIN_HITS", "2"))            # decayed hit score needed to qualify
+PREWARM_HALF_LIFE_TTLS = float(os.getenv("PREWARM_HALF_LIFE_TTLS", "4"))  # hit score half-life, in cache TTLs
+PREWARM_MAX_CHANGES = int(os.getenv("PREWARM_MAX_CHANGES", "3"))       # consecutive content changes before giving up
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", "1"))       # parallel browser renders
+PREWARM_LLM_BUDGET = int(os.getenv("PREWARM_LLM_BUDGET", "20"))        # LLM extractions allowed per pass
+PREWARM_URLS = [u.strip() for u in os.getenv("PREWARM_URLS", "").split(",") if u.strip()]
+
+# Refresh callback: re-parses a URL and returns True if its content changed and needed an LLM call
+RefreshFn = Callable[[str, Callable[[], bool]], Awaitable[bool]]
+
+
+class BudgetExhausted(Exception):
+    """Raised by a refresh that needs an LLM call when the pass budget is spent."""
+
+
+class Prewarmer:
+    def __init__(self, ttl_seconds: int):
+        self._ttl = ttl_seconds
+        self._half_life = ttl_seconds * PREWARM_HALF_LIFE_TTLS
+        self._hits: dict[str, tuple[float, float]] = {}  # url -> (score, time of last update)
+        self._pinned: set[str] = set(PREWARM_URLS)  # from the environment, not removable at runtime
+        self._watchlist: set[str] = set()  # added via the API, persisted in the cache database
+        self._refreshed: dict[str, float] = {}  # url -> timestamp of its current cache entry
+        self._changes: dict[str, int] = {}  # url -> consecutive refreshes that found changed content
+        self._llm_used = 0
+        self._stats = {
+            "passes": 0, "refreshed": 0, "llm_calls": 0, "failed": 0, "budget_skipped": 0,
+            "last_pass_seconds": 0.0, "oldest_due_age_seconds": 0.0,
+        }
+        self._refresh: Optional[RefreshFn] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _score(self, url: str, now: float) -> float:
+        """Hit score decayed by wall-clock time since its last update."""
+        score, stamp = self._hits.get(url, (0.0, now))
+        return score * 0.5 ** ((now - stamp) / self._half_life)
+
+    def record(self, url: str):
+        """Count a /parse request for this URL."""
+        now = time.time()
+        self._hits[url] = (self._score(url, now) + 1, now)
+        # Keep the table bounded; the long tail never qualifies anyway
+        if len(self._hits) > PREWARM_MAX_URLS * 10:
+            keep = sorted(self._hits, key=lambda u: self._score(u, now), reverse=True)[:PREWARM_MAX_URLS * 5]
+            self._hits = {u: self._hits[u] for u in keep}
+
+    def mark_fresh(self, url: str, timestamp: Optional[float] = None, hit: bool = False):
+        """
+        Record the timestamp of the cache entry a caller just got for this URL.
+        A cache hit also proves the content is stable, so a URL that was given up on becomes eligible again.
+        """
+        self._refreshed[url] = timestamp or time.time()
+        if hit:
+            self._changes.pop(url, None)
+
+    def invalidate(self):
+        """Forget entry timestamps after the cache was cleared; no tracked URL has an entry anymore."""
+        self._refreshed.clear()
+
+    @staticmethod
+    async def _ensure_table(db: aiosqlite.Connection):
+        await db.execute("CREATE TABLE IF NOT EXISTS prewarm_watchlist (url TEXT PRIMARY KEY)")
+
+    async def _load_watchlist(self):
+        """Load the persisted watchlist from the cache database."""
+        async with aiosqlite.connect(DB_FILE) as db:
+            await self._ensure_table(db)
+            await db.commit()
+            async with db.execute("SELECT url FROM prewarm_watchlist") as cursor:
+                self._watchlist.update(row[0] for row in await cursor.fetchall())
+
+    def _always_warm(self) -> set[str]:
+        return self._pinned | self._watchlist
+
+    async def add_urls(self, urls: list[str]):
+        """Pin URLs so they are always kept warm. The watchlist counts against PREWARM_MAX_URLS."""
+        new = set(urls) - self._always_warm()
+        if len(self._always_warm()) + len(new) > PREWARM_MAX_URLS:
+            raise ValueError(f"Watchlist is limited to {PREWARM_MAX_URLS} URLs")
+        async with aiosqlite.connect(DB_FILE) as db:
+            await self._ensure_table(db)
+            await db.executemany("INSERT OR IGNORE INTO prewarm_watchlist (url) VALUES (?)", [(u,) for u in new])
+            await db.commit()
+        self._watchlist.update(new)
+
+    async def remove_urls(self, urls: list[str]):
+        """Unpin URLs added via the API. URLs from PREWARM_URLS can only be removed from the environment."""
+        pinned = [u for u in urls if u in self._pinned]
+        if pinned:
+            raise ValueError(f"URLs are pinned via PREWARM_URLS: {', '.join(pinned[:5])}")
+        async with aiosqlite.connect(DB_FILE) as db:
+            await self._ensure_table(db)
+            await db.executemany("DELETE FROM prewarm_watchlist WHERE url = ?", [(u,) for u in urls])
+            await db.commit()
+        self._watchlist.difference_update(urls)
+
+    def _volatile(self, url: str) -> bool:
+        """Content changed on every recent refresh, so callers never hit what we pre-warm."""
+        return self._changes.get(url, 0) >= PREWARM_MAX_CHANGES
+
+    def _targets(self) -> list[str]:
+        """Watchlist plus the hottest learned URLs, up to PREWARM_MAX_URLS, excluding volatile pages."""
+        now = time.time()
+        scores = {url: self._score(url, now) for url in self._hits}
+        always = self._always_warm()
+        hot = sorted((u for u, s in scores.items() if s >= PREWARM_MIN_HITS and u not in always),
+                     key=scores.get, reverse=True)
+        targets = [*always, *hot[:max(PREWARM_MAX_URLS - len(always), 0)]]
+        return [u for u in targets if not self._volatile(u)]
+
+    def _due(self, urls: list[str]) -> list[str]:
+        """URLs whose cache entry is old enough to expire soon, stalest first."""
+        cutoff = time.time() - self._ttl * PREWARM_REFRESH_RATIO
+        due = [u for u in urls if self._refreshed.get(u, 0) <= cutoff]
+        return sorted(due, key=lambda u: self._refreshed.get(u, 0))
+
+    def _take_llm_budget(self) -> bool:
+        """Reserve one LLM call from this pass's budget."""
+        if self._llm_used >= PREWARM_LLM_BUDGET:
+            return False
+        self._llm_used += 1
+        return True
+
+    async def _refresh_one(self, url: str, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            try:
+                changed = await asyncio.wait_for(self._refresh(url, self._take_llm_budget), timeout=90)
+                self._refreshed[url] = time.time()
+                self._stats["refreshed"] += 1
+                if changed:
+                    self._changes[url] = self._changes.get(url, 0) + 1
+                    self._stats["llm_calls"] += 1
+                else:
+                    self._changes.pop(url, None)
+            except BudgetExhausted:
+                # Changed content could not be extracted; the URL stays due and is first in line next pass
+                self._changes[url] = self._changes.get(url, 0) + 1
+                self._stats["budget_skipped"] += 1
+            except Exception as e:
+                # Back off for a full refresh period instead of retrying every pass
+                self._refreshed[url] = time.time()
+                self._stats["failed"] += 1
+                logger.warning(f"Pre-warm failed for {url}: {e}")
+
+    async def run_pass(self):
+        """Refresh every due URL within the concurrency and LLM budget."""
+        started = time.time()
+        targets = self._targets()
+        due = self._due(targets)
+        self._llm_used = 0
+        self._stats["oldest_due_age_seconds"] = round(
+            max((started - self._refreshed[u] for u in due if u in self._refreshed), default=0.0), 1)
+        if due:
+            logger.info(f"Pre-warming {len(due)} of {len(targets)} tracked URLs...")
+            semaphore = asyncio.Semaphore(PREWARM_CONCURRENCY)
+            await asyncio.gather(*(self._refresh_one(url, semaphore) for url in due))
+
+        # Entries refreshed at the end of an overlong pass have already expired
+        duration = time.time() - started
+        self._stats["last_pass_seconds"] = round(duration, 1)
+        if duration > (1 - PREWARM_REFRESH_RATIO) * self._ttl:
+            logger.warning(f"Pre-warm pass took {duration:.0f}s for {len(due)} URLs, longer than the refresh "
+                           f"window; raise PREWARM_CONCURRENCY or lower PREWARM_MAX_URLS")
+
+        # Forget URLs that stopped being requested
+        now = time.time()
+        self._hits = {u: h for u, h in self._hits.items() if self._score(u, now) >= 0.1}
+        keep = self._always_warm() | self._hits.keys()
+        self._refreshed = {u: t for u, t in self._refreshed.items() if u in keep}
+        self._changes = {u: n for u, n in self._changes.items() if u in keep}
+        self._stats["passes"] += 1
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(PREWARM_INTERVAL)
+            try:
+                await self.run_pass()
+            except Exception as e:
+                logger.error(f"Pre-warm pass failed: {e}")
+
+    async def start(self, refresh: RefreshFn):
+        """Load the watchlist and start the background scheduler."""
+        self._refresh = refresh
+        if not PREWARM_ENABLED or self._task is not None:
+            return
+        try:
+            await self._load_watchlist()
+        except Exception as e:
+            # Don't take the service down; pinned and learned URLs are still kept warm
+            logger.error(f"Failed to load pre-warm watchlist: {e}")
+        logger.info("Starting cache pre-warmer...")
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Stop the background scheduler."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> dict:
+        """Get pre-warmer statistics."""
+        targets = self._targets()
+        return {
+            "enabled": PREWARM_ENABLED,
+            "running": self._task is not None,
+            "pinned": sorted(self._pinned),
+            "watchlist": sorted(self._watchlist),
+            "tracked_urls": len(targets),
+            "due_urls": len(self._due(targets)),
+            "volatile_urls": sum(1 for u in self._changes if self._volatile(u)),
+            "interval_seconds": PREWARM_INTERVAL,
+            "concurrency": PREWARM_CONCURRENCY,
+            "llm_budget_per_pass": PREWARM_LLM_BUDGET,
+            **self._stats,
+        }
+
+
+# Global pre-warmer instance, scheduled against the cache TTL
+_prewarmer = Prewarmer(ttl_seconds=get_cache().ttl)
+
+def get_prewarmer() -> Prewarmer:
+    """Get the global pre-warmer instance."""
+    return _prewarmer
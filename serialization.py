@@ -0,0 +1,102 @@
+"""
+Fast JSON encoding, field projection and response compression.
+Uses orjson when installed and falls back to the stdlib json module.
+gzip is always available; brotli is used only if the `brotli` package is installed.
+"""
+import os
+import gzip
+import json
+import logging
+from typing import Any, Iterable, Optional, Union
+from fastapi import Response
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+# Comma-separated list of encodings the server may apply, e.g. "br,gzip" or "" to disable
+COMPRESSION_ENCODINGS = [
+    e.strip() for e in os.getenv("RESPONSE_COMPRESSION", "br,gzip").split(",") if e.strip()
+]
+COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+
+
+def dumps(data: Any) -> bytes:
+    """Serialize data to compact JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Deserialize JSON bytes or text."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def project(data: dict, fields: Optional[Iterable[str]]) -> dict:
+    """Keep only the requested top-level fields. None means all fields."""
+    if fields is None:
+        return data
+    return {k: data[k] for k in fields if k in data}
+
+
+def envelope(data_json: Optional[bytes] = None, error: Optional[str] = None) -> bytes:
+    """
+    Build a ParseResponse body around an already-serialized `data` payload.
+    Lets cached bytes be returned without decoding and re-validating them.
+    """
+    if data_json is not None:
+        return b'{"ok":true,"data":' + data_json + b',"error":null}'
+    return b'{"ok":false,"data":null,"error":' + dumps(error) + b'}'
+
+
+def _pick_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the first server-enabled encoding the client accepts (q > 0)."""
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for part in accept_encoding.split(","):
+        token, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if token:
+            qualities[token.lower()] = q
+    for encoding in COMPRESSION_ENCODINGS:
+        if encoding == "br" and brotli is None:
+            continue
+        # An explicit token, including an explicit refusal, overrides the wildcard
+        if qualities.get(encoding, qualities.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def json_response(body: bytes, accept_encoding: Optional[str] = None) -> Response:
+    """Wrap JSON bytes in a Response, compressing when worthwhile."""
+    headers = {}
+    if COMPRESSION_ENCODINGS and len(body) >= COMPRESSION_MIN_BYTES:
+        # The representation depends on Accept-Encoding even when it is left uncompressed
+        headers["Vary"] = "Accept-Encoding"
+        encoding = _pick_encoding(accept_encoding)
+        if encoding == "br":
+            body = brotli.compress(body, quality=4)
+        elif encoding == "gzip":
+            body = gzip.compress(body, compresslevel=5)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)